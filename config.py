@@ -6,3 +6,12 @@ load_dotenv()  # Load variables from .env file
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
 if not ELEVENLABS_API_KEY:
     raise ValueError("ELEVENLABS_API_KEY not found in environment variables.")
+
+# H.264 encoder for the final reel: "auto" picks a working hardware encoder
+# (NVENC, QSV, VideoToolbox) and falls back to libx264. Set to an encoder
+# name such as "libx264" to force it.
+VIDEO_ENCODER = os.getenv("VIDEO_ENCODER", "auto")
+
+# How the final reel is assembled: "ffmpeg" runs the ffmpeg CLI, "pyav"
+# drives libav in-process through PyAV (needs the `av` package).
+REEL_BACKEND = os.getenv("REEL_BACKEND", "ffmpeg")
@@ -0,0 +1,69 @@
+import hashlib
+import logging
+import os
+import shutil
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, "cache")
+
+
+def hash_file(path: str) -> str:
+    """Returns a BLAKE2b hash of the file contents, read in 1 MiB blocks."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def temp_path_for(path: str, token: str) -> str:
+    """A sibling path to write into before an atomic rename onto `path`.
+
+    The original extension is kept so ffmpeg can still infer the format.
+    """
+    root, ext = os.path.splitext(path)
+    return f"{root}.{token}.tmp{ext}"
+
+
+def remove_if_exists(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def link_or_copy(src: str, dst: str):
+    """Hardlinks src to dst, falling back to a copy across filesystems."""
+    remove_if_exists(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def touch(path: str):
+    """Marks a cache entry as recently used."""
+    os.utime(path)
+
+
+def evict_lru(cache_dir: str, max_bytes: int):
+    """Deletes the least recently used entries until the folder fits max_bytes."""
+    entries = []
+    total = 0
+    with os.scandir(cache_dir) as it:
+        for entry in it:
+            # Skip files another worker is still writing
+            if not entry.is_file() or ".tmp." in entry.name:
+                continue
+            st = entry.stat()
+            entries.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        # Another worker may have evicted it already
+        remove_if_exists(path)
+        logging.info(f"Evicted cache entry: {path}")
+        total -= size
@@ -0,0 +1,29 @@
+import os
+
+READ_CHUNK_SIZE = 1 << 16
+
+
+def read_small(path) -> str:
+    """Reads a small UTF-8 file with raw os calls, skipping the text-io stack."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        chunks = []
+        while True:
+            chunk = os.read(fd, READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return b"".join(chunks).decode("utf-8")
+    finally:
+        os.close(fd)
+
+
+def write_small(path, data: str):
+    """Writes a small UTF-8 file with raw os calls, replacing any old contents."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data.encode("utf-8"))
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
@@ -2,11 +2,16 @@ from flask import Flask, render_template, request, jsonify
 import uuid
 from werkzeug.utils import secure_filename
 import shutil
+import os
+import functools
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from waitress import serve
 import logging
 
-from processing import generate_video
+from fileio import write_small
+from video_tasks import celery_app, process_video_task
 
 # --- Configuration ---
 BASE_DIR = Path(__file__).resolve().parent
@@ -15,11 +20,15 @@ STATIC_REELS_DIR = BASE_DIR / "static" / "reels"
 STATIC_THUMBNAILS_DIR = BASE_DIR / "static" / "thumbnails"
 DONE_FILE = BASE_DIR / "done.txt"
 FAILED_FILE = BASE_DIR / "failed.txt"
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'mp4', 'mov', 'mp3', 'wav', 'aac'}
+ALLOWED_EXTENSIONS = frozenset(
+    {'png', 'jpg', 'jpeg', 'mp4', 'mov', 'mp3', 'wav', 'aac'})
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = str(UPLOAD_FOLDER)  # Flask config needs a string
 
+# The per-job files are independent, so they are written concurrently
+upload_pool = ThreadPoolExecutor(max_workers=8)
+
 # Setup basic logging
 logging.basicConfig(
     level=logging.INFO,
@@ -29,8 +38,14 @@ logging.basicConfig(
 
 
 def allowed_file(filename):
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    i = filename.rfind('.')
+    return i != -1 and filename[i + 1:].lower() in ALLOWED_EXTENSIONS
+
+
+def write_input_list(path, input_files):
+    """Writes the ffmpeg concat list for the uploaded clips in one write."""
+    write_small(path, ''.join(
+        f"file '{filename}'\nduration {duration}\n" for filename, duration in input_files))
 
 
 @app.route("/")
@@ -43,6 +58,8 @@ def create():
     if request.method == "POST":
         job_id = request.form.get("uuid")
         desc = request.form.get("text")
+        # Lets the worker skip the TTS stage for jobs without narration
+        has_desc = bool(desc and desc.strip())
         voice_id = request.form.get("voice")
 
         # Basic validation for the received ID
@@ -57,12 +74,14 @@ def create():
         durations = request.form.getlist("durations")
 
         input_files = []
+        pending_writes = []
         # Pair each file with its duration
         for i, file in enumerate(uploaded_files):
             if file and file.filename and allowed_file(file.filename):
                 # Use a unique name to avoid overwrites and simplify ffmpeg input
                 unique_filename = f"{uuid.uuid4().hex}{Path(secure_filename(file.filename)).suffix}"
-                file.save(upload_path / unique_filename)
+                pending_writes.append(upload_pool.submit(
+                    file.save, upload_path / unique_filename))
                 input_files.append(
                     (unique_filename, durations[i] if i < len(durations) else "3"))
 
@@ -76,46 +95,67 @@ def create():
             # Save with a consistent name for the worker to find
             music_filename = "music" + \
                 Path(secure_filename(music_file.filename)).suffix
-            music_file.save(upload_path / music_filename)
-            app.logger.info(f"Saved background music for job {job_id}")
+            pending_writes.append(upload_pool.submit(
+                music_file.save, upload_path / music_filename))
+            app.logger.info(f"Saving background music for job {job_id}")
 
         # Write description and voice files for the worker to use
-        if desc:
-            with open(upload_path / "desc.txt", "w", encoding="utf-8") as f:
-                f.write(desc)
+        if has_desc:
+            pending_writes.append(upload_pool.submit(
+                write_small, upload_path / "desc.txt", desc))
 
         if voice_id:
-            with open(upload_path / "voice.txt", "w", encoding="utf-8") as f:
-                f.write(voice_id)
+            pending_writes.append(upload_pool.submit(
+                write_small, upload_path / "voice.txt", voice_id))
 
         # Write the ffmpeg input file once with all filenames
         if input_files:
-            with open(upload_path / "input.txt", "w") as f:
-                for filename, duration in input_files:
-                    f.write(f"file '{filename}'\nduration {duration}\n")
-
-        # --- Process the video directly ---
-        try:
-            generate_video(job_id)
-            # Since processing is synchronous, we return success upon completion.
-            return jsonify({"success": True, "job_id": job_id, "message": "Reel created successfully!"})
-        except Exception as e:
-            app.logger.error(f"Video generation failed for job {job_id}: {e}")
-            return jsonify({"success": False, "message": f"Video generation failed: {e}"}), 500
+            pending_writes.append(upload_pool.submit(
+                write_input_list, upload_path / "input.txt", input_files))
+
+        # Everything has to be on disk before a worker picks the job up;
+        # result() also re-raises any write error.
+        for future in pending_writes:
+            future.result()
+
+        # --- Hand the job off to a Celery worker ---
+        # Processing takes tens of seconds, so we return right away and let
+        # the client poll /status/<task_id> for progress.
+        task = process_video_task.delay(job_id, has_desc=has_desc)
+        app.logger.info(f"Queued job {job_id} as task {task.id}")
+        return jsonify({"success": True, "job_id": job_id, "task_id": task.id})
 
     myid = str(uuid.uuid4())
     return render_template("create.html", myid=myid)
 
 
+@app.route("/status/<task_id>")
+def task_status(task_id):
+    task = celery_app.AsyncResult(task_id)
+    info = task.info
+    # On failure Celery stores the raised exception instead of our meta dict
+    if isinstance(info, Exception):
+        info = {"message": str(info) or "An unknown error occurred.", "progress": -1}
+    return jsonify({"state": task.state, "info": info or {}})
+
+
+@functools.lru_cache(maxsize=1)
+def _list_reels(dir_mtime_ns):
+    """
+    Reel filenames, newest first. Cached on the folder's mtime, so the
+    folder is only re-scanned after a reel is added or removed.
+    """
+    with os.scandir(STATIC_REELS_DIR) as it:
+        # is_file() uses the type from the listing; each entry is stat'ed once
+        entries = [(e.name, e.stat().st_mtime) for e in it if e.is_file()]
+    entries.sort(key=itemgetter(1), reverse=True)
+    return tuple(name for name, _ in entries)
+
+
 @app.route("/gallery")
 def gallery():
     try:
-        # Sort reels by modification time (newest first)
-        reel_files = sorted(
-            [p.name for p in STATIC_REELS_DIR.iterdir() if p.is_file()],
-            key=lambda f: (STATIC_REELS_DIR / f).stat().st_mtime,
-            reverse=True
-        )
+        reel_files = _list_reels(os.stat(STATIC_REELS_DIR).st_mtime_ns)
     except FileNotFoundError:
         reel_files = []
 
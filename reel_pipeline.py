@@ -0,0 +1,686 @@
+import logging
+import subprocess
+import shutil
+import os
+import uuid
+import functools
+import itertools
+import json
+from fractions import Fraction
+import ahocorasick
+from better_profanity import profanity
+
+try:
+    import av  # Optional: only needed for REEL_BACKEND=pyav
+except ImportError:
+    av = None
+
+from config import VIDEO_ENCODER, REEL_BACKEND
+from file_cache import (CACHE_DIR, hash_file, temp_path_for, remove_if_exists,
+                        link_or_copy, touch, evict_lru)
+from fileio import read_small, write_small
+from text_to_audio import text_to_speech_file
+
+# --- Configuration ---
+# Plain strings rather than Path objects: they go straight into ffmpeg
+# command lines and os calls without conversion.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+USER_UPLOADS = os.path.join(BASE_DIR, "user_uploads")
+STATIC_REELS = os.path.join(BASE_DIR, "static", "reels")
+STATIC_THUMBNAILS = os.path.join(BASE_DIR, "static", "thumbnails")
+DEFAULT_VOICE_ID = "pNInz6obpgDQGcFmaJgB"  # Adam
+MAX_TEXT_LENGTH = 1500  # Max characters for TTS to prevent abuse
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg'}
+VIDEO_FILTER = 'scale=1080:1920:force_original_aspect_ratio=decrease,pad=1080:1920:(ow-iw)/2:(oh-ih)/2:black'
+THUMBNAIL_FILTER = 'select=gte(t\\,1)'  # First frame at or after 1s
+CLIP_CACHE = os.path.join(CACHE_DIR, "clips")  # Normalized clips, keyed by source hash
+CLIP_CACHE_MAX_BYTES = 5 * 1024 ** 3
+REEL_FPS = 30
+# Only errors reach stderr, so a successful run produces almost no output
+FFMPEG_QUIET_ARGS = ['-hide_banner', '-loglevel', 'error', '-nostats']
+AUDIO_SAMPLE_RATE = 44100
+
+# --- Video Encoders ---
+# Hardware encoders are tried in this order; libx264 is the fallback.
+HW_ENCODER_ARGS = {
+    'h264_nvenc': ['-c:v', 'h264_nvenc', '-preset', 'p4', '-rc', 'vbr',
+                   '-cq', '23', '-b:v', '0', '-pix_fmt', 'yuv420p'],
+    'h264_qsv': ['-c:v', 'h264_qsv', '-preset', 'veryfast',
+                 '-global_quality', '23', '-pix_fmt', 'nv12'],
+    'h264_videotoolbox': ['-c:v', 'h264_videotoolbox', '-b:v', '4M',
+                          '-pix_fmt', 'yuv420p'],
+}
+SOFTWARE_ENCODER_ARGS = ['-c:v', 'libx264', '-pix_fmt', 'yuv420p']
+_video_encoder = None  # Detected once per process, see _detect_video_encoder
+
+# --- Profanity Filter ---
+# better_profanity counts these as part of a word, besides letters and digits
+PROFANITY_WORD_CHARS = frozenset('@$*"\'')
+_profanity_automaton = None  # Built once per process from the wordlist
+_profanity_fold_table = None  # One symbol per better_profanity substitution group
+
+
+def _detect_video_encoder():
+    """Picks the H.264 encoder for the reel and caches it for the process."""
+    global _video_encoder
+    if _video_encoder is not None:
+        return _video_encoder
+
+    _video_encoder = 'libx264'
+    if VIDEO_ENCODER != 'auto':
+        _video_encoder = VIDEO_ENCODER
+    else:
+        try:
+            result = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'], check=True,
+                                    capture_output=True, text=True, encoding='utf-8')
+            available = result.stdout
+        except (OSError, subprocess.CalledProcessError) as e:
+            logging.warning(f"Could not list ffmpeg encoders: {e}")
+            available = ''
+
+        for name, args in HW_ENCODER_ARGS.items():
+            if name not in available:
+                continue
+            # Builds often list encoders whose device or driver is missing,
+            # so make sure a short test encode actually succeeds.
+            test_command = ['ffmpeg', '-hide_banner', '-f', 'lavfi',
+                            '-i', 'color=black:s=1080x1920:d=0.1', *args, '-f', 'null', '-']
+            if subprocess.run(test_command, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL).returncode == 0:
+                _video_encoder = name
+                break
+
+    logging.info(f"Using video encoder: {_video_encoder}")
+    return _video_encoder
+
+
+def _video_encoder_args():
+    """ffmpeg output arguments for the selected video encoder."""
+    return HW_ENCODER_ARGS.get(_detect_video_encoder(), SOFTWARE_ENCODER_ARGS)
+
+
+def _build_fold_table(char_mapping):
+    """
+    Maps every character to one symbol per substitution group. The groups
+    overlap ("*" stands in for any vowel, "1" for i or l), so they are
+    merged until no character is in two of them.
+    """
+    groups = []
+    for letter, substitutes in char_mapping.items():
+        group = {letter, *substitutes}
+        for other in [g for g in groups if g & group]:
+            group |= other
+            groups.remove(other)
+        groups.append(group)
+    return str.maketrans({char: min(group) for group in groups for char in group})
+
+
+def _get_profanity_automaton():
+    """
+    Builds an Aho-Corasick automaton over the folded better_profanity
+    wordlist, so any spelling better_profanity accepts is found as a
+    candidate. Each key maps to (length, [original words]).
+    """
+    global _profanity_automaton, _profanity_fold_table
+    if _profanity_automaton is None:
+        if not profanity.CENSOR_WORDSET:
+            profanity.load_censor_words()
+        fold_table = _build_fold_table(profanity.CHARS_MAPPING)
+        candidates = {}
+        for word in profanity.CENSOR_WORDSET:
+            word = str(word).lower()
+            candidates.setdefault(word.translate(fold_table), []).append(word)
+        automaton = ahocorasick.Automaton()
+        for key, words in candidates.items():
+            automaton.add_word(key, (len(key), words))
+        automaton.make_automaton()
+        _profanity_fold_table = fold_table
+        _profanity_automaton = automaton
+    return _profanity_automaton
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char in PROFANITY_WORD_CHARS
+
+
+def _matches_censor_word(candidate: str, word: str) -> bool:
+    """Checks a candidate letter by letter against better_profanity's substitutions."""
+    mapping = profanity.CHARS_MAPPING
+    return all(char in mapping.get(letter, (letter,))
+               for letter, char in zip(word, candidate))
+
+
+def _iter_censor_matches(haystack: str):
+    """Yields (start, end) of every wordlist entry in the lowercased text."""
+    automaton = _get_profanity_automaton()
+    for end, (length, words) in automaton.iter(haystack.translate(_profanity_fold_table)):
+        start = end - length + 1
+        if any(_matches_censor_word(haystack[start:end + 1], word) for word in words):
+            yield start, end
+
+
+def _contains_profanity(text: str) -> bool:
+    """
+    Scans the text for any wordlist entry, including the obfuscated
+    spellings better_profanity catches ("f*ck", "bu11shit"). Like
+    better_profanity, a match has to cover whole words, so e.g. "class"
+    doesn't trip on "ass". The words may be taken as written or joined
+    without their separators ("f.u.c.ks").
+    """
+    haystack = text.lower()
+    for start, end in _iter_censor_matches(haystack):
+        if (start == 0 or not _is_word_char(haystack[start - 1])) and \
+                (end + 1 == len(haystack) or not _is_word_char(haystack[end + 1])):
+            return True
+
+    # better_profanity also joins each word with up to
+    # MAX_NUMBER_COMBINATIONS following ones, dropping the separators.
+    words = [''.join(chars) for is_word, chars in
+             itertools.groupby(haystack, key=_is_word_char) if is_word]
+    word_starts, word_ends, position = {}, {}, 0
+    for index, word in enumerate(words):
+        word_starts[position] = index
+        position += len(word)
+        word_ends[position - 1] = index
+    for start, end in _iter_censor_matches(''.join(words)):
+        if start in word_starts and end in word_ends and \
+                word_ends[end] - word_starts[start] <= profanity.MAX_NUMBER_COMBINATIONS:
+            return True
+    return False
+
+
+def _text_to_audio(job_id: str, has_desc: bool = True):
+    """
+    Generates audio from files in the job directory. `has_desc` is False
+    when the client sent no description, which skips the file reads and
+    checks entirely.
+    """
+    if not has_desc:
+        logging.info(f"No description for '{job_id}'. Skipping audio generation.")
+        return True
+
+    logging.info(f"Attempting to generate audio for '{job_id}'.")
+    job_dir = os.path.join(USER_UPLOADS, job_id)
+    desc_path = os.path.join(job_dir, "desc.txt")
+    voice_id_path = os.path.join(job_dir, "voice.txt")
+
+    try:
+        text = read_small(desc_path).strip()
+        if not text:
+            logging.warning(
+                f"Description file for '{job_id}' is empty. Skipping audio generation.")
+            return True
+
+        # Security checks
+        if len(text) > MAX_TEXT_LENGTH:
+            raise ValueError(
+                f"Text exceeds the maximum length of {MAX_TEXT_LENGTH} characters.")
+        if _contains_profanity(text):
+            raise ValueError("Inappropriate content detected in text.")
+
+        try:
+            voice_id = read_small(voice_id_path).strip()
+        except FileNotFoundError:
+            voice_id = DEFAULT_VOICE_ID
+
+        logging.info(
+            f"Generating audio for '{job_id}' with text: {text[:50]}...")
+        if not text_to_speech_file(text, job_id, voice_id):
+            raise RuntimeError("Failed to generate speech file.")
+        return True
+
+    except FileNotFoundError:
+        logging.warning(
+            f"desc.txt not found for '{job_id}'. No audio will be generated.")
+        return True  # Not a fatal error if no text is provided
+
+
+def _run_ffmpeg(command):
+    """
+    Runs an ffmpeg command quietly. stdout is discarded and stderr is kept
+    as raw bytes, only decoded by the caller when the command fails.
+    """
+    return subprocess.run([command[0], *FFMPEG_QUIET_ARGS, *command[1:]], check=True,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def _read_input_list(input_txt_path: str):
+    """Parses an ffmpeg concat list into (filename, duration) pairs."""
+    entries = []
+    filename = None
+    for line in read_small(input_txt_path).splitlines():
+        if line.startswith("file "):
+            filename = line[len("file "):].strip().strip("'")
+        elif line.startswith("duration ") and filename:
+            entries.append((filename, line[len("duration "):].strip()))
+            filename = None
+    return entries
+
+
+@functools.lru_cache(maxsize=256)
+def _probe_video(path: str):
+    """Returns codec, size and pixel format of the first video stream, or None."""
+    command = ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+               '-show_entries', 'stream=codec_name,width,height,pix_fmt',
+               '-of', 'json', path]
+    try:
+        result = subprocess.run(command, check=True, capture_output=True,
+                                text=True, encoding='utf-8')
+        streams = json.loads(result.stdout).get('streams', [])
+    except (subprocess.CalledProcessError, json.JSONDecodeError) as e:
+        logging.warning(f"Could not probe '{path}': {e}")
+        return None
+    return streams[0] if streams else None
+
+
+def _is_reel_ready(path: str):
+    """True if the clip is already a 1080x1920 yuv420p H.264 video."""
+    if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS:
+        return False
+    stream = _probe_video(path)
+    return bool(stream) and stream.get('codec_name') == 'h264' \
+        and stream.get('width') == 1080 and stream.get('height') == 1920 \
+        and stream.get('pix_fmt') == 'yuv420p'
+
+
+def _normalize_clip(src_path: str, cached_path: str):
+    """Scales and pads one clip to 1080x1920 and stores it in the clip cache."""
+    tmp_path = temp_path_for(cached_path, uuid.uuid4().hex)
+    if cached_path.endswith('.png'):
+        command = ['ffmpeg', '-i', src_path, '-vf', VIDEO_FILTER,
+                   '-frames:v', '1', '-y', tmp_path]
+    else:
+        command = ['ffmpeg', '-i', src_path, '-vf', VIDEO_FILTER, '-an',
+                   '-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '18',
+                   '-pix_fmt', 'yuv420p', '-y', tmp_path]
+
+    try:
+        _run_ffmpeg(command)
+    except subprocess.CalledProcessError as e:
+        logging.error(
+            f"Error normalizing '{src_path}':\n{e.stderr.decode('utf-8', 'replace')}")
+        remove_if_exists(tmp_path)
+        raise
+    # Atomic, so concurrent jobs with the same clip never see a partial file
+    os.replace(tmp_path, cached_path)
+
+
+def _preprocess_inputs(job_id: str):
+    """
+    Scales and pads every input clip to 1080x1920 ahead of the reel encode.
+    Normalized clips are cached by content hash, so reused assets and job
+    retries skip the ffmpeg run.
+    """
+    logging.info(f"Normalizing input clips for '{job_id}'.")
+    job_dir = os.path.join(USER_UPLOADS, job_id)
+    normalized = []
+    # evict_lru below scans it even if every clip is skipped
+    os.makedirs(CLIP_CACHE, exist_ok=True)
+
+    entries = _read_input_list(os.path.join(job_dir, "input.txt"))
+    for filename, duration in entries:
+        src_path = os.path.join(job_dir, filename)
+        stem, ext = os.path.splitext(filename)
+        if len(entries) == 1 and _is_reel_ready(src_path):
+            # _create_reel will stream-copy this clip, so leave it untouched
+            normalized.append((filename, duration))
+            continue
+
+        suffix = '.png' if ext.lower() in IMAGE_EXTENSIONS else '.mp4'
+        cached_path = os.path.join(
+            CLIP_CACHE, f"{hash_file(src_path)}_1080x1920{suffix}")
+        try:
+            # Touching a hit also makes it the newest entry for evict_lru
+            touch(cached_path)
+            logging.info(f"Reusing normalized clip for '{filename}': {cached_path}")
+        except FileNotFoundError:
+            _normalize_clip(src_path, cached_path)
+
+        # Link into the job folder so evicting the cache entry can't pull
+        # the file out from under this job.
+        dst_name = f"norm_{stem}{suffix}"
+        link_or_copy(cached_path, os.path.join(job_dir, dst_name))
+        normalized.append((dst_name, duration))
+
+    evict_lru(CLIP_CACHE, CLIP_CACHE_MAX_BYTES)
+
+    # Written last so _create_reel only sees a complete list
+    write_small(os.path.join(job_dir, "input_normalized.txt"), ''.join(
+        f"file '{filename}'\nduration {duration}\n" for filename, duration in normalized))
+    return True
+
+
+def _create_reel(job_id: str):
+    """Creates a video reel and its thumbnail in a single ffmpeg run."""
+    logging.info(f"Creating reel for '{job_id}'.")
+    job_dir = os.path.join(USER_UPLOADS, job_id)
+    input_txt_path = os.path.join(job_dir, "input.txt")
+    # Written inside the job folder and moved into static/ once complete,
+    # so a crashed run never leaves a partial reel for _reel_exists to see.
+    output_mp4_path = os.path.join(job_dir, "reel.mp4")
+    thumbnail_path = os.path.join(job_dir, "thumbnail.jpg")
+
+    # One directory read answers every "is this file here?" question below
+    with os.scandir(job_dir) as it:
+        job_files = {entry.name for entry in it}
+    music_name = next(
+        (name for name in job_files if name.startswith("music.")), None)
+
+    # Stream copy is decided from the raw uploads: a normalized clip is
+    # also 1080x1920 H.264, but it's a quick intermediate, not a final encode.
+    upload_entries = _read_input_list(input_txt_path)
+    copy_video = len(upload_entries) == 1 and \
+        _is_reel_ready(os.path.join(job_dir, upload_entries[0][0]))
+
+    # Clips from _preprocess_inputs are already 1080x1920, so the scale/pad
+    # filter is only needed when reading the raw uploads.
+    if "input_normalized.txt" in job_files:
+        input_txt_path = os.path.join(job_dir, "input_normalized.txt")
+        entries = _read_input_list(input_txt_path)
+        video_filter = 'null'
+    else:
+        entries = upload_entries
+        video_filter = VIDEO_FILTER
+
+    # The PyAV backend skips the ffmpeg process but doesn't scale, so it
+    # only takes normalized clips that actually need an encode.
+    if REEL_BACKEND == 'pyav' and av is not None and not copy_video \
+            and video_filter == 'null':
+        audio_tracks = []
+        if "audio.mp3" in job_files:
+            audio_tracks.append(
+                (os.path.join(job_dir, "audio.mp3"), 1.0 if music_name else None))
+        if music_name:
+            audio_tracks.append(
+                (os.path.join(job_dir, music_name), 0.15 if audio_tracks else 0.3))
+        _create_reel_pyav(job_dir, entries, audio_tracks,
+                          output_mp4_path, thumbnail_path)
+        _publish_reel(job_id, output_mp4_path, thumbnail_path)
+        logging.info(f"Reel created successfully with PyAV for '{job_id}'.")
+        return True
+
+    if copy_video:
+        # A single clip that already matches the output format: copy the
+        # video stream instead of re-encoding it. It is still decoded for
+        # the thumbnail output.
+        command = ['ffmpeg', '-i', os.path.join(job_dir, upload_entries[0][0])]
+    else:
+        command = ['ffmpeg', '-f', 'concat',
+                   '-safe', '0', '-i', input_txt_path]
+
+    has_voiceover = "audio.mp3" in job_files
+    has_music = music_name is not None
+
+    if has_voiceover:
+        command.extend(['-i', os.path.join(job_dir, "audio.mp3")])
+    if has_music:
+        command.extend(['-i', os.path.join(job_dir, music_name)])
+
+    # --- Define Filters and Mappings ---
+    if copy_video:
+        filters = []
+        video_map = '0:v'
+    else:
+        # The video is split so the thumbnail is written from the same
+        # decode pass instead of re-reading the MP4.
+        filters = [
+            f'[0:v]{video_filter},split=2[vout][vthumb];[vthumb]{THUMBNAIL_FILTER}[thumb]']
+        video_map = '[vout]'
+
+    # Define audio filters for clarity
+    music_only_filter = '[1:a]volume=0.3[aout]'
+    mixed_audio_filter = '[1:a]aformat=fltp,volume=1.0[a1];[2:a]aformat=fltp,volume=0.15[a2];[a1][a2]amix=inputs=2:duration=first[aout]'
+
+    if has_voiceover and has_music:
+        # Voiceover is input 1, Music is input 2
+        filters.append(mixed_audio_filter)
+        audio_map = ['-map', '[aout]']
+    elif has_voiceover:
+        # Voiceover is input 1
+        audio_map = ['-map', '1:a']
+    elif has_music:
+        # Music is input 1
+        filters.append(music_only_filter)
+        audio_map = ['-map', '[aout]']
+    else:
+        # Map video only, no audio
+        audio_map = []
+
+    if filters:
+        command.extend(['-filter_complex', ';'.join(filters)])
+    command.extend(['-map', video_map] + audio_map)
+
+    # --- Add Output Encoding Options and Output Files ---
+    if copy_video:
+        command.extend(['-c:v', 'copy', '-c:a', 'aac', '-movflags', '+faststart',
+                        '-shortest', '-y', output_mp4_path])
+        command.extend(['-map', '0:v', '-vf', THUMBNAIL_FILTER, '-frames:v', '1',
+                        '-y', thumbnail_path])
+    else:
+        command.extend(_video_encoder_args())
+        command.extend(['-c:a', 'aac', '-r', '30',
+                       '-shortest', '-y', output_mp4_path])
+        command.extend(['-map', '[thumb]', '-frames:v', '1',
+                        '-y', thumbnail_path])
+
+    try:
+        _run_ffmpeg(command)
+    except subprocess.CalledProcessError as e:
+        logging.error(
+            f"Error creating reel for '{job_id}'. ffmpeg command failed.")
+        logging.error(
+            f"ffmpeg stderr:\n{e.stderr.decode('utf-8', 'replace')}")
+        raise  # Re-raise the exception to fail the Celery task
+    _publish_reel(job_id, output_mp4_path, thumbnail_path)
+    logging.info(f"Reel created successfully for '{job_id}'.")
+    return True
+
+
+def _reel_paths(job_id: str):
+    """Final locations of a job's reel and thumbnail."""
+    return (os.path.join(STATIC_REELS, f"{job_id}.mp4"),
+            os.path.join(STATIC_THUMBNAILS, f"{job_id}.jpg"))
+
+
+def _reel_exists(job_id: str) -> bool:
+    """
+    True if the job already finished, so a retry has nothing to do. Only
+    the MP4 counts: a reel shorter than 1s never gets a thumbnail.
+    """
+    return os.path.exists(_reel_paths(job_id)[0])
+
+
+def _publish_reel(job_id: str, output_mp4_path: str, thumbnail_path: str):
+    """
+    Moves the finished files into static/. The MP4 goes last, so its
+    presence means the job is done.
+    """
+    final_mp4_path, final_thumbnail_path = _reel_paths(job_id)
+    try:
+        shutil.move(thumbnail_path, final_thumbnail_path)
+    except FileNotFoundError:
+        # No frame at or after 1s. Don't fail the whole job for a thumbnail.
+        logging.warning(f"No thumbnail was generated for '{job_id}'.")
+    shutil.move(output_mp4_path, final_mp4_path)
+
+
+# --- In-process Reel Assembly (PyAV) ---
+
+
+def _encoder_options(args):
+    """Splits ffmpeg encoder arguments into PyAV's (codec, pix_fmt, options)."""
+    opts = dict(zip(args[::2], args[1::2]))
+    codec = opts.pop('-c:v')
+    pix_fmt = opts.pop('-pix_fmt')
+    # '-preset p4' -> {'preset': 'p4'}, '-b:v 4M' -> {'b': '4M'}
+    return codec, pix_fmt, {k.lstrip('-').split(':')[0]: v for k, v in opts.items()}
+
+
+def _iter_clip_frames(path: str, duration: str):
+    """Yields `duration` seconds of one normalized clip at REEL_FPS."""
+    n_frames = max(1, round(float(duration) * REEL_FPS))
+    with av.open(path) as clip:
+        frames = clip.decode(video=0)
+        if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS:
+            still = next(frames)
+            for _ in range(n_frames):
+                yield still
+            return
+
+        # Repeat or drop decoded frames to resample the clip to REEL_FPS,
+        # then hold the last frame if the clip is shorter than `duration`.
+        emitted = 0
+        current = None
+        start = None
+        for frame in frames:
+            if start is None:
+                start = frame.time
+            while current is not None and emitted < n_frames \
+                    and emitted / REEL_FPS < frame.time - start:
+                yield current
+                emitted += 1
+            if emitted >= n_frames:
+                return
+            current = frame
+        while current is not None and emitted < n_frames:
+            yield current
+            emitted += 1
+
+
+def _drain(sink):
+    """Pulls every frame the filter graph has ready."""
+    while True:
+        try:
+            yield sink.pull()
+        except (BlockingIOError, EOFError):
+            return
+
+
+def _iter_mixed_audio(tracks):
+    """
+    Mirrors the ffmpeg audio filters. `tracks` is [(container, volume)],
+    where volume None means pass-through; several tracks are mixed with
+    amix using the length of the first, and the output is converted to
+    what the AAC encoder takes.
+    """
+    graph = av.filter.Graph()
+    out_format = graph.add(
+        'aformat', f'sample_fmts=fltp:sample_rates={AUDIO_SAMPLE_RATE}:channel_layouts=stereo')
+    mix = graph.add('amix', f'inputs={len(tracks)}:duration=first') \
+        if len(tracks) > 1 else None
+
+    sources = []
+    for i, (container, volume) in enumerate(tracks):
+        source = graph.add_abuffer(template=container.streams.audio[0])
+        head = source
+        if volume is not None:
+            head = graph.add('volume', str(volume))
+            source.link_to(head)
+        if mix:
+            head.link_to(mix, 0, i)
+        else:
+            head.link_to(out_format)
+        sources.append(source)
+    if mix:
+        mix.link_to(out_format)
+    sink = graph.add('abuffersink')
+    out_format.link_to(sink)
+    graph.configure()
+
+    # Feed the inputs in lockstep so amix never has to buffer a whole track
+    decoders = [container.decode(audio=0) for container, _ in tracks]
+    live = list(range(len(decoders)))
+    while live:
+        for i in list(live):
+            frame = next(decoders[i], None)
+            if frame is None:
+                sources[i].push(None)  # End of this input
+                live.remove(i)
+            else:
+                sources[i].push(frame)
+        yield from _drain(sink)
+
+
+def _write_thumbnail(frame, path: str):
+    """Encodes a single frame to JPEG."""
+    with av.open(path, 'w', format='image2') as thumb:
+        stream = thumb.add_stream('mjpeg', rate=1)
+        stream.width = frame.width
+        stream.height = frame.height
+        stream.pix_fmt = 'yuvj420p'
+        jpeg_frame = frame.reformat(format='yuvj420p')
+        jpeg_frame.pts = 0
+        thumb.mux(stream.encode(jpeg_frame))
+        thumb.mux(stream.encode(None))
+
+
+def _create_reel_pyav(job_dir: str, entries, audio_tracks,
+                      output_mp4_path: str, thumbnail_path: str):
+    """
+    In-process equivalent of the ffmpeg reel command: concatenates the
+    normalized clips at REEL_FPS, mixes the audio, stops at the shorter of
+    the two (like -shortest) and writes the 1s frame as the thumbnail.
+    `audio_tracks` is [(path, volume)], voiceover first.
+    """
+    codec, pix_fmt, options = _encoder_options(_video_encoder_args())
+    audio_inputs = [(av.open(path), volume) for path, volume in audio_tracks]
+    try:
+        total_seconds = sum(max(1, round(float(duration) * REEL_FPS))
+                            for _, duration in entries) / REEL_FPS
+        if audio_inputs and audio_inputs[0][0].duration:
+            total_seconds = min(total_seconds,
+                                audio_inputs[0][0].duration / av.time_base)
+        frame_time_base = Fraction(1, REEL_FPS)
+
+        with av.open(output_mp4_path, 'w') as output:
+            video_stream = output.add_stream(codec, rate=REEL_FPS, options=options)
+            video_stream.width = 1080
+            video_stream.height = 1920
+            video_stream.pix_fmt = pix_fmt
+            # PyAV defaults to a 1 Mbps target; 0 leaves rate control to the
+            # encoder options, like the CLI (libx264 then uses CRF 23).
+            video_stream.bit_rate = 0
+            audio_stream = output.add_stream('aac', rate=AUDIO_SAMPLE_RATE) \
+                if audio_inputs else None
+
+            audio_frames = _iter_mixed_audio(audio_inputs) if audio_inputs else iter(())
+            next_audio = next(audio_frames, None)
+
+            clip_frames = itertools.chain.from_iterable(
+                _iter_clip_frames(os.path.join(job_dir, filename), duration)
+                for filename, duration in entries)
+            for index, frame in enumerate(
+                    itertools.islice(clip_frames, round(total_seconds * REEL_FPS))):
+                if index == REEL_FPS:  # First frame at or after 1s
+                    _write_thumbnail(frame, thumbnail_path)
+                out_frame = frame.reformat(width=1080, height=1920, format=pix_fmt)
+                out_frame.pts = index
+                out_frame.time_base = frame_time_base
+                output.mux(video_stream.encode(out_frame))
+
+                # Keep the audio interleaved with the video as we go
+                while next_audio is not None and next_audio.time <= index / REEL_FPS:
+                    output.mux(audio_stream.encode(next_audio))
+                    next_audio = next(audio_frames, None)
+            output.mux(video_stream.encode(None))
+
+            if audio_stream:
+                while next_audio is not None and next_audio.time < total_seconds:
+                    output.mux(audio_stream.encode(next_audio))
+                    next_audio = next(audio_frames, None)
+                output.mux(audio_stream.encode(None))
+    finally:
+        for container, _ in audio_inputs:
+            container.close()
+
+
+def _cleanup_job_dir(job_id: str):
+    """Removes the temporary upload folder for a job."""
+    try:
+        job_dir = os.path.join(USER_UPLOADS, job_id)
+        if os.path.isdir(job_dir):
+            shutil.rmtree(job_dir)
+            logging.info(f"Cleaned up temporary directory: {job_dir}")
+    except Exception as cleanup_error:
+        logging.warning(
+            f"Could not clean up directory for {job_id}: {cleanup_error}")
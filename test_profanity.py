@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+os.environ.setdefault("ELEVENLABS_API_KEY", "test-key")  # config.py requires one
+
+from better_profanity import profanity  # noqa: E402
+
+from reel_pipeline import _contains_profanity  # noqa: E402
+
+SAMPLES = [
+    "what the f*ck",
+    "this is sh*t",
+    "you are a b*tch",
+    "bu11shit",
+    "fvck this",
+    "sh1t happens",
+    "a$$hole",
+    "@ss",
+    "b1tch",
+    "sh!t happens",
+    "f*ck*",
+    "d@mn it",
+    "f.u.c.ks",
+    "s.h.i.ts",
+    "s_h_i_ts",
+    "day?HERPES'SHAMEDAME-s.h.i.t.ing",
+    "what the fuck",
+    "FUCK",
+    "a nice day at the beach",
+    "the class passed the assessment",
+    "scunthorpe",
+    "I love my cat",
+    "1 2 3 go",
+    "v*ry good",
+    "",
+]
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_matches_better_profanity(text):
+    assert _contains_profanity(text) == profanity.contains_profanity(text)
+
+
+# better_profanity lets these through: it never joins a one-character final
+# word, and splits wordlist entries like "sh!+" apart before matching.
+# They still get rejected.
+STRICTER_SAMPLES = [
+    "f.u.c.k",
+    "F-U-C-K",
+    "good-SH!+",
+]
+
+
+@pytest.mark.parametrize("text", STRICTER_SAMPLES)
+def test_catches_what_better_profanity_misses(text):
+    assert _contains_profanity(text)
+    assert not profanity.contains_profanity(text)
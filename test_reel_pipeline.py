@@ -0,0 +1,24 @@
+import os
+
+os.environ.setdefault("ELEVENLABS_API_KEY", "test-key")  # config.py requires one
+
+import reel_pipeline  # noqa: E402
+
+
+def test_preprocess_single_ready_clip_with_empty_cache(tmp_path, monkeypatch):
+    uploads = tmp_path / "user_uploads"
+    job_dir = uploads / "job"
+    job_dir.mkdir(parents=True)
+    (job_dir / "clip.mp4").write_bytes(b"")
+    (job_dir / "input.txt").write_text("file 'clip.mp4'\nduration 5\n")
+    clip_cache = tmp_path / "cache" / "clips"
+
+    monkeypatch.setattr(reel_pipeline, "USER_UPLOADS", str(uploads))
+    monkeypatch.setattr(reel_pipeline, "CLIP_CACHE", str(clip_cache))
+    monkeypatch.setattr(reel_pipeline, "_is_reel_ready", lambda path: True)
+
+    assert reel_pipeline._preprocess_inputs("job")
+    assert clip_cache.is_dir()
+    # The ready clip is left for _create_reel to stream-copy
+    assert (job_dir / "input_normalized.txt").read_text() == \
+        "file 'clip.mp4'\nduration 5\n"
@@ -3,25 +3,75 @@ from elevenlabs import VoiceSettings
 from elevenlabs.client import ElevenLabs
 from config import ELEVENLABS_API_KEY
 from elevenlabs.core import ApiError
-from pathlib import Path
+from file_cache import (CACHE_DIR, temp_path_for, remove_if_exists,
+                        link_or_copy, touch, evict_lru)
+import hashlib
 import logging
+import os
+import uuid
+import httpx
 
 
+ELEVENLABS_API_URL = "https://api.elevenlabs.io"
+
+# One pooled HTTP/2 client per process, so the TLS handshake is paid once
+# and later requests reuse the warm connection.
+http_client = httpx.Client(
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=8, keepalive_expiry=300),
+    timeout=60,
+)
+
 client = ElevenLabs(
     api_key=ELEVENLABS_API_KEY,
+    httpx_client=http_client,
 )
 
 
-BASE_DIR = Path(__file__).resolve().parent
+def warm_up_connection():
+    """Opens the pooled connection to ElevenLabs ahead of the first job."""
+    try:
+        http_client.head(ELEVENLABS_API_URL)
+    except httpx.HTTPError as e:
+        logging.warning(f"Could not warm up the ElevenLabs connection: {e}")
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# The response streams many small chunks; buffer them so they reach the
+# disk in a few large writes instead of one syscall per chunk.
+WRITE_BUFFER_SIZE = 1 << 20
+
+MODEL_ID = "eleven_turbo_v2_5"  # use the turbo model for low latency
+OUTPUT_FORMAT = "mp3_22050_32"
+TTS_CACHE = os.path.join(CACHE_DIR, "tts")  # Generated speech, keyed by request hash
+TTS_CACHE_MAX_BYTES = 1024 ** 3
+
+
+def _cache_key(text: str, voice_id: str) -> str:
+    return hashlib.sha256(
+        f"{MODEL_ID}|{OUTPUT_FORMAT}|{voice_id}|{text}".encode("utf-8")).hexdigest()
 
 
 def text_to_speech_file(text: str, folder: str, voice_id: str) -> bool:
+    save_file_path = os.path.join(BASE_DIR, "user_uploads", folder, "audio.mp3")
+    cached_path = os.path.join(TTS_CACHE, f"{_cache_key(text, voice_id)}.mp3")
+
+    # The same text and voice always give the same audio, so reuse it
+    try:
+        touch(cached_path)
+        link_or_copy(cached_path, save_file_path)
+        logging.info(
+            f"{save_file_path}: Reused cached audio {os.path.basename(cached_path)}")
+        return True
+    except FileNotFoundError:
+        pass
+
     # Calling the text_to_speech conversion API with detailed parameters
     response = client.text_to_speech.convert(
         voice_id=voice_id,
-        output_format="mp3_22050_32",
+        output_format=OUTPUT_FORMAT,
         text=text,
-        model_id="eleven_turbo_v2_5",  # use the turbo model for low latency
+        model_id=MODEL_ID,
         # Optional voice settings that allow you to customize the output
         voice_settings=VoiceSettings(
             stability=0.0,
@@ -35,23 +85,28 @@ def text_to_speech_file(text: str, folder: str, voice_id: str) -> bool:
     # uncomment the line below to play the audio back
     # play(response)
 
-    save_file_path = BASE_DIR / "user_uploads" / folder / "audio.mp3"
-
-    # Writing the audio to a file
+    # Writing the audio to the cache, then linking it into the job folder
+    os.makedirs(TTS_CACHE, exist_ok=True)
+    tmp_path = temp_path_for(cached_path, uuid.uuid4().hex)
     try:
-        with open(save_file_path, "wb") as f:
+        with open(tmp_path, "wb", buffering=WRITE_BUFFER_SIZE) as f:
             for chunk in response:
                 if chunk:
                     f.write(chunk)
+        os.replace(tmp_path, cached_path)
+        link_or_copy(cached_path, save_file_path)
 
         logging.info(
             f"{save_file_path}: A new audio file was saved successfully!")
+        evict_lru(TTS_CACHE, TTS_CACHE_MAX_BYTES)
         return True
     except ApiError as e:
         logging.error(f"API error during audio generation for {folder}: {e}")
+        remove_if_exists(tmp_path)
         return False
     except IOError as e:
         logging.error(f"File write error for {save_file_path}: {e}")
+        remove_if_exists(tmp_path)
         return False
 
 
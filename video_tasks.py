@@ -1,21 +1,14 @@
 import logging
 import subprocess
-import shutil
-from pathlib import Path
-import json
-from better_profanity import profanity
-from celery import Celery
-from celery.signals import worker_process_init
-
-from text_to_audio import text_to_speech_file
-
-# --- Configuration ---
-BASE_DIR = Path(__file__).resolve().parent
-USER_UPLOADS = BASE_DIR / "user_uploads"
-STATIC_REELS = BASE_DIR / "static" / "reels"
-STATIC_THUMBNAILS = BASE_DIR / "static" / "thumbnails"
-DEFAULT_VOICE_ID = "pNInz6obpgDQGcFmaJgB"  # Adam
-MAX_TEXT_LENGTH = 1500  # Max characters for TTS to prevent abuse
+from celery import Celery, Task, chord, group
+from celery.concurrency.prefork import TaskPool as PreforkPool
+from celery.concurrency.solo import TaskPool as SoloPool
+from celery.signals import worker_init, worker_process_init, worker_ready
+
+from reel_pipeline import (_detect_video_encoder, _get_profanity_automaton,
+                           _text_to_audio, _preprocess_inputs, _create_reel,
+                           _cleanup_job_dir, _reel_exists)
+from text_to_audio import warm_up_connection
 
 # --- Celery App Definition ---
 # The first argument is the project name, broker is the Redis URL,
@@ -26,6 +19,29 @@ celery_app = Celery(
     backend='redis://localhost:6379/0'
 )
 
+# --- Queue Routing ---
+# TTS is network-bound and ffmpeg is CPU-bound, so each gets its own queue
+# and worker pool. The entry task only builds the workflow, so it shares
+# the lightweight TTS queue.
+TTS_QUEUE = 'tts_queue'
+FFMPEG_QUEUE = 'ffmpeg_queue'
+celery_app.conf.task_routes = {
+    'video_tasks.process_video_task': {'queue': TTS_QUEUE},
+    'video_tasks.tts_task': {'queue': TTS_QUEUE},
+    'video_tasks.preprocess_inputs': {'queue': FFMPEG_QUEUE},
+    'video_tasks.create_reel': {'queue': FFMPEG_QUEUE},
+}
+
+# --- Retries ---
+# Tasks are acknowledged only once they finish, so a worker crash
+# redelivers the job. The ffmpeg stages also retry on a failed run; each
+# stage only writes its own outputs, so re-running one is safe.
+FFMPEG_RETRY_OPTIONS = {
+    'autoretry_for': (subprocess.CalledProcessError,),
+    'retry_backoff': True,
+    'max_retries': 3,
+}
+
 # --- Logging Setup ---
 # We set up logging when a worker process starts.
 
@@ -41,188 +57,127 @@ def setup_logging(**kwargs):
         ]
     )
 
-# --- Helper Functions (Adapted from generate_process.py) ---
-
-
-def _text_to_audio(job_id: str):
-    """Generates audio from files in the job directory."""
-    logging.info(f"Attempting to generate audio for '{job_id}'.")
-    job_dir = USER_UPLOADS / job_id
-    desc_path = job_dir / "desc.txt"
-    voice_id_path = job_dir / "voice.txt"
-
-    try:
-        text = desc_path.read_text(encoding="utf-8").strip()
-        if not text:
-            logging.warning(
-                f"Description file for '{job_id}' is empty. Skipping audio generation.")
-            return True
-
-        # Security checks
-        if len(text) > MAX_TEXT_LENGTH:
-            raise ValueError(
-                f"Text exceeds the maximum length of {MAX_TEXT_LENGTH} characters.")
-        if profanity.contains_profanity(text):
-            raise ValueError("Inappropriate content detected in text.")
-
-        try:
-            voice_id = voice_id_path.read_text(encoding="utf-8").strip()
-        except FileNotFoundError:
-            voice_id = DEFAULT_VOICE_ID
-
-        logging.info(
-            f"Generating audio for '{job_id}' with text: {text[:50]}...")
-        return text_to_speech_file(text, job_id, voice_id)
-
-    except FileNotFoundError:
-        logging.warning(
-            f"desc.txt not found for '{job_id}'. No audio will be generated.")
-        return True  # Not a fatal error if no text is provided
-
-
-def _create_reel(job_id: str):
-    """Creates a video reel using ffmpeg."""
-    logging.info(f"Creating reel for '{job_id}'.")
-    job_dir = USER_UPLOADS / job_id
-    input_txt_path = job_dir / "input.txt"
-    audio_mp3_path = job_dir / "audio.mp3"
-    music_files = list(job_dir.glob("music.*"))
-    music_path = music_files[0] if music_files else None
-    output_mp4_path = STATIC_REELS / f"{job_id}.mp4"
-
-    command = ['ffmpeg', '-f', 'concat',
-               '-safe', '0', '-i', str(input_txt_path)]
-
-    has_voiceover = audio_mp3_path.exists()
-    has_music = music_path and music_path.exists()
-
-    if has_voiceover:
-        command.extend(['-i', str(audio_mp3_path)])
-    if has_music:
-        command.extend(['-i', str(music_path)])
-
-    # --- Define Filters and Mappings ---
-    video_filter = 'scale=1080:1920:force_original_aspect_ratio=decrease,pad=1080:1920:(ow-iw)/2:(oh-ih)/2:black'
-
-    # Define audio filters for clarity
-    music_only_filter = '[1:a]volume=0.3[aout]'
-    mixed_audio_filter = '[1:a]aformat=fltp,volume=1.0[a1];[2:a]aformat=fltp,volume=0.15[a2];[a1][a2]amix=inputs=2:duration=first[aout]'
-
-    if has_voiceover and has_music:
-        # Voiceover is input 1, Music is input 2
-        # Apply complex filter and map the correct streams to the output
-        command.extend(['-filter_complex', f'{video_filter},{mixed_audio_filter}',
-                       '-map', '0:v', '-map', '[aout]'])
-    elif has_voiceover:
-        # Voiceover is input 1
-        command.extend(['-vf', video_filter, '-map', '0:v', '-map', '1:a'])
-    elif has_music:
-        # Music is input 1
-        # Apply video filter to input 0, audio filter to input 1, and map the results
-        command.extend(['-filter_complex', f'[0:v]{video_filter}[vout];{music_only_filter}',
-                        '-map', '[vout]', '-map', '[aout]'])
-    else:
-        # Map video only, no audio
-        command.extend(['-vf', video_filter, '-map', '0:v'])
-
-    # --- Add Output Encoding Options and Output File ---
-    command.extend(['-c:v', 'libx264', '-c:a', 'aac', '-r', '30',
-                   '-pix_fmt', 'yuv420p', '-shortest', '-y', str(output_mp4_path)])
-
-    try:
-        result = subprocess.run(
-            command, check=True, capture_output=True, text=True, encoding='utf-8')
-        logging.info(f"Reel created successfully: {output_mp4_path}")
-        return True
-    except subprocess.CalledProcessError as e:
-        logging.error(
-            f"Error creating reel for '{job_id}'. ffmpeg command failed.")
-        logging.error(f"ffmpeg stderr:\n{e.stderr}")
-        raise  # Re-raise the exception to fail the Celery task
-
-
-def _create_thumbnail(job_id: str):
-    """Extracts the first frame of the video to use as a thumbnail."""
-    logging.info(f"Creating thumbnail for '{job_id}'.")
-    video_path = STATIC_REELS / f"{job_id}.mp4"
-    thumbnail_path = STATIC_THUMBNAILS / f"{job_id}.jpg"
-
-    command = ['ffmpeg', '-i', str(video_path), '-ss', '00:00:01.000',
-               '-vframes', '1', '-y', str(thumbnail_path)]
-    try:
-        subprocess.run(command, check=True, capture_output=True,
-                       text=True, encoding='utf-8')
-        logging.info(f"Thumbnail created successfully: {thumbnail_path}")
-        return True
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Error creating thumbnail for '{job_id}':\n{e.stderr}")
-        return False  # Don't fail the whole job for a thumbnail
-
-
-# --- The Celery Task ---
-@celery_app.task(bind=True)
-def process_video_task(self, job_id: str):
+
+def _consumes_tts_queue():
+    return TTS_QUEUE in celery_app.amqp.queues.consume_from
+
+
+@worker_init.connect
+def build_tts_state(**kwargs):
+    # Built in the main process before the pool starts, so forked children
+    # share it copy-on-write.
+    if _consumes_tts_queue():
+        _get_profanity_automaton()
+
+
+@worker_process_init.connect
+def warm_up_worker(**kwargs):
+    # Probe the encoders and open the TTS connection up front, in each
+    # prefork (or solo) process, so the first job doesn't pay for either.
+    # Every process owns its own connection.
+    _detect_video_encoder()
+    if _consumes_tts_queue():
+        warm_up_connection()
+
+
+@worker_ready.connect
+def warm_up_tts_worker(sender, **kwargs):
+    # Pools that don't fork (gevent, eventlet, threads) never send
+    # worker_process_init and run their tasks in this process. A forking
+    # pool's children warm themselves, so the parent must not open a
+    # connection they would inherit.
+    if isinstance(sender.pool, (PreforkPool, SoloPool)):
+        return
+    if _consumes_tts_queue():
+        warm_up_connection()
+
+
+# --- The Celery Tasks ---
+class JobStageTask(Task):
     """
-    This is the main Celery task that processes a video job.
-    The `bind=True` argument makes `self` available to update task state.
+    Base class for the pipeline stages. Progress is reported against the
+    root task id (the one returned to the client), and a failing stage
+    cleans up the job's upload folder.
     """
-    logging.info(f"--- Processing new job: {job_id} ---")
-    try:
-        # Step 1: Generate Audio
-        self.update_state(state='PROGRESS', meta={
-                          'message': 'Generating audio...', 'progress': 30})
-        _text_to_audio(job_id)
-
-        # Step 2: Create Reel
-        self.update_state(state='PROGRESS', meta={
-                          'message': 'Creating video...', 'progress': 60})
+
+    def report_progress(self, message: str, progress: int):
+        self.update_state(task_id=self.request.root_id or self.request.id,
+                          state='PROGRESS',
+                          meta={'message': message, 'progress': progress})
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        job_id = args[0] if args else kwargs.get('job_id')
+        logging.error(f"Task {self.name} for job {job_id} failed: {exc}")
+        if job_id:
+            _cleanup_job_dir(job_id)
+
+
+@celery_app.task(bind=True, base=JobStageTask, queue=TTS_QUEUE, acks_late=True)
+def tts_task(self, job_id: str):
+    """Generates the voiceover. Network-bound: waits on ElevenLabs."""
+    self.report_progress('Generating audio...', 30)
+    return _text_to_audio(job_id)
+
+
+@celery_app.task(bind=True, base=JobStageTask, queue=FFMPEG_QUEUE,
+                 acks_late=True, **FFMPEG_RETRY_OPTIONS)
+def preprocess_inputs(self, job_id: str):
+    """Normalizes the input clips. CPU-bound: runs ffmpeg while TTS is in flight."""
+    self.report_progress('Preparing clips...', 30)
+    return _preprocess_inputs(job_id)
+
+
+@celery_app.task(bind=True, base=JobStageTask, queue=FFMPEG_QUEUE,
+                 acks_late=True, **FFMPEG_RETRY_OPTIONS)
+def create_reel(self, job_id: str):
+    """Encodes the reel and thumbnail, then removes the job's upload folder."""
+    if _reel_exists(job_id):
+        # Redelivered after the reel was published
+        logging.info(f"--- Reel already exists, skipping: {job_id} ---")
+    else:
+        self.report_progress('Creating video...', 60)
         _create_reel(job_id)
+    _cleanup_job_dir(job_id)
+    logging.info(f"--- Successfully finished processing: {job_id} ---")
+    return {'message': 'Complete', 'progress': 100}
+
+
+def build_video_workflow(job_id: str, has_desc: bool = True):
+    """
+    TTS and clip normalization run in parallel; the reel (and its
+    thumbnail) is encoded once both are done. Jobs without a description
+    skip the TTS stage.
+    """
+    if not has_desc:
+        return preprocess_inputs.si(job_id) | create_reel.si(job_id)
+    return chord(
+        group(tts_task.si(job_id), preprocess_inputs.si(job_id)),
+        create_reel.si(job_id),
+    )
 
-        # Step 3: Create Thumbnail
-        self.update_state(state='PROGRESS', meta={
-                          'message': 'Generating thumbnail...', 'progress': 90})
-        _create_thumbnail(job_id)
-
-        # --- Final Step: Cleanup ---
-        # The job is done, so we can remove the temporary upload folder.
-        try:
-            job_dir = USER_UPLOADS / job_id
-            if job_dir.is_dir():
-                shutil.rmtree(job_dir)
-                logging.info(f"Cleaned up temporary directory: {job_dir}")
-        except Exception as cleanup_error:
-            logging.warning(
-                f"Could not clean up directory for {job_id}: {cleanup_error}")
-
-        logging.info(f"--- Successfully finished processing: {job_id} ---")
-        return {'message': 'Complete', 'progress': 100}
-
-    except Exception as e:
-        logging.error(f"Task for job {job_id} failed: {e}")
-        # This will mark the task as FAILED in Celery
-        # The frontend will receive the 'FAILURE' state.
-        self.update_state(
-            state='FAILURE',
-            meta={'message': str(
-                e) or 'An unknown error occurred.', 'progress': -1}
-        )
-        # Also attempt to clean up on failure
-        try:
-            job_dir = USER_UPLOADS / job_id
-            if job_dir.is_dir():
-                shutil.rmtree(job_dir)
-                logging.info(
-                    f"Cleaned up temporary directory after failure: {job_dir}")
-        except Exception as cleanup_error:
-            logging.warning(
-                f"Could not clean up directory for {job_id} after failure: {cleanup_error}")
-
-        # Re-raise the exception to ensure Celery knows it's a failure
-        raise
+
+@celery_app.task(bind=True, queue=TTS_QUEUE, acks_late=True)
+def process_video_task(self, job_id: str, has_desc: bool = True):
+    """
+    Entry point for a video job. It replaces itself with the stage workflow,
+    so the final stage inherits this task's id and the client can keep
+    polling the id returned by `delay()`.
+    """
+    if _reel_exists(job_id):
+        logging.info(f"--- Reel already exists, skipping: {job_id} ---")
+        _cleanup_job_dir(job_id)
+        return {'message': 'Already done', 'progress': 100}
+
+    logging.info(f"--- Processing new job: {job_id} ---")
+    self.update_state(state='PROGRESS', meta={
+                      'message': 'Queued...', 'progress': 10})
+    return self.replace(build_video_workflow(job_id, has_desc))
 
 
 if __name__ == "__main__":
     # This allows you to test the task directly if needed,
     # but it should be run by a Celery worker.
     print("This file defines Celery tasks and is not meant to be run directly.")
-    print("Start a worker with: celery -A video_tasks worker --loglevel=info")
+    print("Start the workers with:")
+    print("  celery -A video_tasks worker -Q tts_queue --pool=gevent --concurrency=32 --loglevel=info")
+    print("  celery -A video_tasks worker -Q ffmpeg_queue --pool=prefork --concurrency=$(nproc) --loglevel=info")